@@ -1,28 +1,64 @@
 import argparse
-import copy
+import atexit
+import functools
+import gzip
+import hashlib
+import json
 import logging.config
 import os
+import pickle
 import pprint
+import queue
 import re
+import sys
+import threading
 import urllib.parse
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
-from typing import Iterator, Sequence, Any, Generator
+from typing import Iterable, Iterator, Sequence, Any, Generator
 
-import bs4
 import requests
-import stringcase
-import yaml
+import urllib3
 from requests import HTTPError
+from requests.adapters import HTTPAdapter
+from selectolax.lexbor import LexborHTMLParser, LexborNode
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+
+except ImportError:
+    orjson = None
 
 log = logging.getLogger(f"uexcorp-openapi.{__name__}")
 
 logging_config_file = Path(__file__).parent / "config" / "logging.ini"
 logging.config.fileConfig(logging_config_file.absolute())
 
+cache_dir = Path(__file__).parent / "cache"
+# changes with every edit of this file, e.g. of the parameter defaults or the link generation
+generator_version = hashlib.sha1(Path(__file__).read_bytes(), usedforsecurity=False).hexdigest()
+
+# all sessions are created with verify=False, the warnings would only flood the log
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# number of concurrent requests, the connection pool of each session is sized to match
+MAX_WORKERS = 16
+
+_RE_METHOD_TH = re.compile(r"\s*Method\s*")
+_RE_INPUT_TH = re.compile(r"\s*Input\s*")
+_RE_ID_PATH = re.compile(r".*/id/([^/]*)")
+_RE_TYPE_INFO = re.compile(r"(?P<name>[^(]+)(\((?P<length>\d+)\))?")
+_RE_ITEMS_ID = re.compile(r"^items")
+_RE_LEADING_SEPARATOR = re.compile(r"^[\-_.]")
+_RE_SEPARATED_LOWER = re.compile(r"[\-_.\s]([a-z])")
+_CACHE_KEY_RE = re.compile(r"[/?=&]")
+_CACHE_KEY_MAP = {"/": "-", "?": "__", "=": "--", "&": "__"}
 
-@dataclass
+
+@dataclass(slots=True)
 class Settings:
     base_path = "https://api.uexcorp.space/2.0"
     docs_path = "https://uexcorp.space/api/documentation/"
@@ -30,6 +66,20 @@ class Settings:
     api_cache: bool = False
 
 
+def create_http_adapter() -> HTTPAdapter:
+    return HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=MAX_WORKERS,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # hand the last response over to raise_for_status, failures are handled as HTTPError
+            raise_on_status=False,
+        ),
+    )
+
+
 def create_api_session() -> requests.Session:
     app_token = os.environ.get("APP_TOKEN")
     if not app_token:
@@ -42,6 +92,7 @@ def create_api_session() -> requests.Session:
         raise Exception("USER_TOKEN not found in environment variables")
 
     api_session = requests.Session()
+    api_session.mount("https://", create_http_adapter())
     api_session.verify = False
     api_session.headers.update({
         "Authorization": "Bearer " + app_token,
@@ -52,12 +103,7 @@ def create_api_session() -> requests.Session:
 
 
 def create_cache_key(_str: str) -> str:
-    _str = _str.strip("/")
-    _str = _str.replace("/", "-")
-    _str = _str.replace("?", "__")
-    _str = _str.replace("=", "--")
-    _str = _str.replace("&", "__")
-    return _str
+    return _CACHE_KEY_RE.sub(lambda m: _CACHE_KEY_MAP[m.group()], _str.strip("/"))
 
 
 def get_from_cache_or_request(session: requests.Session, url: str, settings: Settings) -> str:
@@ -66,10 +112,10 @@ def get_from_cache_or_request(session: requests.Session, url: str, settings: Set
     query_part = create_cache_key(url_parts.query)
     cache_key = f"{path_part}__{query_part}" if query_part else path_part
     ext = "json" if "documentation" not in url_parts.path else "html"
-    cache_path = Path(__file__).parent / "cache" / f"{cache_key}.{ext}"
+    cache_path = cache_dir / f"{cache_key}.{ext}"
     if cache_path.exists() and settings.api_cache:
         log.debug(f"using cache for {url}")
-        return cache_path.read_text()
+        return cache_path.read_text(encoding="utf-8", errors="replace")
 
     log.debug(f"GET {url}")
     response = session.get(url)
@@ -81,12 +127,129 @@ def get_from_cache_or_request(session: requests.Session, url: str, settings: Set
         log.debug(f"response: %s", response.text)
         raise
 
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    cache_path.write_text(response.text, encoding="utf-8", errors="replace")
+    content = response.text.encode("utf-8", errors="replace")
+    if not cache_path.exists() or cache_path.read_bytes() != content:
+        _ensure_cache_writer()
+        cache_write_queue.put((cache_path, content))
+
     return response.text
 
 
-@dataclass(frozen=True)
+cache_write_queue: queue.Queue[tuple[Path, bytes]] = queue.Queue()
+_cache_writer_lock = threading.Lock()
+_cache_writer_started = False
+
+
+def _ensure_cache_writer():
+    global _cache_writer_started
+    with _cache_writer_lock:
+        if _cache_writer_started:
+            return
+
+        threading.Thread(target=write_cache_files, name="cache-writer", daemon=True).start()
+        # the writer thread is a daemon, make sure queued files are written before exiting
+        atexit.register(cache_write_queue.join)
+        _cache_writer_started = True
+
+
+def write_cache_files():
+    while True:
+        cache_path, content = cache_write_queue.get()
+        try:
+            # written under a temporary name first, an interrupted run must not leave a truncated file behind
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_cache_path = cache_path.with_name(f"{cache_path.name}.tmp")
+            tmp_cache_path.write_bytes(content)
+            os.replace(tmp_cache_path, cache_path)
+
+        except OSError:
+            log.exception("failed to write cache file %s", cache_path)
+
+        finally:
+            cache_write_queue.task_done()
+
+
+def canonical_key(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS, default=str)
+
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+def load_yaml(fd) -> Any:
+    # yaml is imported lazily, only the modes working with the spec files need it
+    import yaml
+    # the C implementations are only available when PyYAML is built with libyaml
+    return yaml.load(fd, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def load_yaml_file(path: str | Path) -> Any:
+    with open(path, "rb") as fd:
+        return load_yaml(fd)
+
+
+def dump_yaml(data: Any, fd, **kwargs):
+    import yaml
+    yaml.dump(data, fd, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper), **kwargs)
+
+
+# converts `_`, `-` and `.` separated names to PascalCase, this only matches stringcase.pascalcase for
+# underscore separated input, names are derived from the same few endpoint ids over and over
+@functools.lru_cache(maxsize=None)
+def pascalcase(_str: str) -> str:
+    _str = _RE_LEADING_SEPARATOR.sub("", _str)
+    if not _str:
+        return _str
+
+    return _str[0].upper() + _RE_SEPARATED_LOWER.sub(lambda m: m.group(1).upper(), _str[1:])
+
+
+def is_json_native(obj: Any) -> bool:
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if not all(isinstance(key, str) for key in value):
+                return False
+
+            stack.extend(value.values())
+
+        elif isinstance(value, list):
+            stack.extend(value)
+
+        elif value is not None and not isinstance(value, (str, int, float, bool)):
+            return False
+
+    return True
+
+
+def dump_json(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+
+    return json.dumps(obj).encode()
+
+
+def load_json(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def copy_json(obj: Any) -> Any:
+    return load_json(dump_json(obj))
+
+
+def find_next_sibling(node: LexborNode, tag: str) -> LexborNode | None:
+    sibling = node.next
+    while sibling is not None and sibling.tag != tag:
+        sibling = sibling.next
+
+    return sibling
+
+
+@dataclass(frozen=True, slots=True)
 class UEXEndpointParameter:
     name: str
     type: str
@@ -94,13 +257,13 @@ class UEXEndpointParameter:
     is_required: bool
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class UEXEndpointLink:
     link: str
-    required_params: list[UEXEndpointParameter]
+    required_params: tuple[UEXEndpointParameter, ...]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class UEXEndpoint:
     id: str
     method: str
@@ -108,7 +271,7 @@ class UEXEndpoint:
     description: str
     docs_url: str
     is_user_bound: bool
-    links: list[UEXEndpointLink]
+    links: tuple[UEXEndpointLink, ...]
 
 
 class UEXEndpointDocsParser:
@@ -171,6 +334,48 @@ class UEXEndpointDocsParser:
         "archetypes": "strategist",
     }
 
+    default_overrides_by_id = {
+        "categories": {
+            "type": "item",
+            "section": "other",
+        },
+        "marketplace_listings": {
+            "id": "9Nor6zAazH",
+            "slug": "training-mining-and-refining-9Nor6zAazH",
+        },
+        "organizations": {
+            "slug": "uexcorp",
+        },
+        "terminals": {
+            "type": "commodity",
+        },
+        "commodities_raw_prices": {
+            "id_terminal": "237,241",
+            "id_commodity": 45,
+        },
+        "commodities_prices_history": {
+            "id_terminal": 74,
+            "id_commodity": 68,
+        },
+        "vehicles_loaners": {
+            "id_vehicle": 19,
+        },
+        "vehicles_purchases_prices": {
+            "id_vehicle": 19,
+            "id_terminal": 148,
+        },
+        "vehicles_rentals_prices": {
+            "id_vehicle": 148,
+            "id_terminal": 150,
+        },
+    }
+
+    # used for all endpoints with id starting with "items" unless overridden above
+    items_default_overrides = {
+        "id_item": 1743,
+        "id_terminal": 268,
+    }
+
     required_args_all = {
         "commodities_prices_history",
     }
@@ -179,144 +384,110 @@ class UEXEndpointDocsParser:
         self.url = url
         self.get_templated_paths = get_templated_paths
 
-        self.soup = bs4.BeautifulSoup(content, "html.parser")
-        self.table = self.soup.select_one("#table-documentation")
+        self.tree = LexborHTMLParser(content)
+        self.table = self.tree.css_first("#table-documentation")
         log.debug("parsing endpoint docs at %s", self.url)
 
-        self.id = self.get_id()
+        match = _RE_ID_PATH.match(str(self.url))
+        self.id = match.group(1) if match else None
+        self._method = self.get_table_value(_RE_METHOD_TH).text().strip()
+        self._base_path = self.tree.css_first("h2.text-monospace").text(deep=False).strip()
+        self._description = self.tree.css_first("h4.mgb-20").text().strip()
+        self._input_td = self.get_table_value(_RE_INPUT_TH)
+        self._is_user_bound = any(
+            tag.text().strip() == "secret_key"
+            for tag in self._input_td.css("strong.text-violet")
+        )
+
+        required_name_tags = []
+        optional_name_tags = []
+        for input_name_tag in self._input_td.css("strong"):
+            if "text-red" in (input_name_tag.attributes.get("class") or "").split():
+                required_name_tags.append(input_name_tag)
+
+            else:
+                optional_name_tags.append(input_name_tag)
+
+        self._required_params = tuple(self.parse_parameters_from_name_tags(required_name_tags, is_required=True))
+        self._optional_params = tuple(self.parse_parameters_from_name_tags(optional_name_tags, is_required=False))
+
+        if self.id in self.default_overrides_by_id:
+            self._default_overrides = self.default_overrides_by_id[self.id]
+
+        elif self.id and _RE_ITEMS_ID.match(self.id):
+            self._default_overrides = self.items_default_overrides
+
+        else:
+            self._default_overrides = {}
 
     def __hash__(self):
-        return hash((self.url, self.get_id()))
+        return hash((self.url, self.id))
 
     def get_defaults(self, parameter_name: str, default=None):
         if self.get_templated_paths:
             return f"{{{parameter_name}}}"
 
-        default_overrides = {}
-        match self.get_id():
-            case "categories":
-                default_overrides = {
-                    "type": "item",
-                    "section": "other",
-                }
-
-            case "marketplace_listings":
-                default_overrides = {
-                    "id": "9Nor6zAazH",
-                    "slug": "training-mining-and-refining-9Nor6zAazH",
-                }
-
-            case "organizations":
-                default_overrides = {
-                    "slug": "uexcorp",
-                }
-
-            case "terminals":
-                default_overrides = {
-                    "type": "commodity",
-                }
-
-            case "commodities_raw_prices":
-                default_overrides = {
-                    "id_terminal": "237,241",
-                    "id_commodity": 45,
-                }
-
-            case "commodities_prices_history":
-                default_overrides = {
-                    "id_terminal": 74,
-                    "id_commodity": 68,
-                }
-
-            case "vehicles_loaners":
-                default_overrides = {
-                    "id_vehicle": 19,
-                }
-
-            case "vehicles_purchases_prices":
-                default_overrides = {
-                    "id_vehicle": 19,
-                    "id_terminal": 148,
-                }
-
-            case "vehicles_rentals_prices":
-                default_overrides = {
-                    "id_vehicle": 148,
-                    "id_terminal": 150,
-                }
-
-            case _ if re.match(r"^items", self.get_id()):
-                default_overrides = {
-                    "id_item": 1743,
-                    "id_terminal": 268,
-                }
-
-        if parameter_name in default_overrides:
-            return default_overrides[parameter_name]
-
-        return self.defaults.get(parameter_name, default)
+        return self._default_overrides.get(parameter_name, self.defaults.get(parameter_name, default))
 
     def get_id(self) -> str:
-        match = re.match(r".*/id/([^/]*)", str(self.url))
-        return match.group(1) if match else None
+        return self.id
+
+    def get_table_value(self, label: re.Pattern) -> LexborNode | None:
+        for header_tag in self.table.css("th"):
+            if label.search(header_tag.text()):
+                return find_next_sibling(header_tag, "td")
+
+        return None
 
     def get_method(self) -> str:
-        return self.table.find("th", string=re.compile(r"\s*Method\s*")).find_next_sibling("td").text.strip()
+        return self._method
 
     def get_base_path(self):
-        return self.soup.find("h2", class_="text-monospace").find(string=True, recursive=False).strip()
+        return self._base_path
 
     def get_description(self):
-        return self.soup.find("h4", class_="mgb-20").text.strip()
+        return self._description
 
     def is_user_bound(self) -> bool:
-        input_name_tags = self.table.find("th", string=re.compile(r"\s*Input\s*")) \
-            .find_next_sibling("td") \
-            .find_all("strong", class_="text-violet")
-
-        for tag in input_name_tags:
-            if tag.text.strip() == "secret_key":
-                return True
-
-        return False
-
-    def get_required_parameters(self):
-        input_name_tags = self.table.find("th", string=re.compile(r"\s*Input\s*")) \
-            .find_next_sibling("td") \
-            .find_all("strong", class_="text-red")
-
-        yield from self.parse_parameters_from_name_tags(input_name_tags, is_required=True)
+        return self._is_user_bound
 
-    def get_optional_parameters(self):
-        input_name_tags = self.table.find("th", string=re.compile(r"\s*Input\s*")) \
-            .find_next_sibling("td") \
-            .find_all("strong")
-        input_name_tags = list(filter(lambda tag: "text-red" not in tag.get("class", ""), input_name_tags))
+    def get_required_parameters(self) -> tuple[UEXEndpointParameter, ...]:
+        return self._required_params
 
-        yield from self.parse_parameters_from_name_tags(input_name_tags, is_required=False)
+    def get_optional_parameters(self) -> tuple[UEXEndpointParameter, ...]:
+        return self._optional_params
 
-    def parse_parameters_from_name_tags(self, input_name_tags: Sequence[bs4.Tag], **kwargs) -> Generator[UEXEndpointParameter, Any, None]:
+    def parse_parameters_from_name_tags(self, input_name_tags: Sequence[LexborNode], **kwargs) -> Generator[UEXEndpointParameter, Any, None]:
         for input_name_tag in input_name_tags:
-            parameter_name = input_name_tag.text.strip()
+            parameter_name = input_name_tag.text().strip()
             if parameter_name == "secret_key":
                 continue
 
-            type_info_tag = input_name_tag.find_next_sibling("em")
-            type_info = re.match(r"(?P<name>[^(]+)(\((?P<length>\d+)\))?", type_info_tag.text)
-            log.debug("parsed parameter type and length from (%s) and (%s): %s", input_name_tag, type_info_tag, type_info)
+            type_info_tag = find_next_sibling(input_name_tag, "em")
+            type_info = _RE_TYPE_INFO.match(type_info_tag.text())
+            log.debug("parsed parameter type and length from (%s) and (%s): %s", input_name_tag.html, type_info_tag.html, type_info)
             yield UEXEndpointParameter(
-                name=input_name_tag.text.strip(),
+                name=parameter_name,
                 type=type_info["name"].strip(),
                 length=int(type_info["length"]) if type_info["length"] else 0,
                 **kwargs,
             )
 
     def create_method_paths_for_all_params(self) -> Iterator[UEXEndpointLink]:
+        seen_links = set()
+        for endpoint_link in self.create_method_paths_for_all_required_params():
+            if endpoint_link.link in seen_links:
+                continue
+
+            seen_links.add(endpoint_link.link)
+            yield endpoint_link
+
+    def create_method_paths_for_all_required_params(self) -> Iterator[UEXEndpointLink]:
         base_endpoint_path = self.get_base_path()
-        required_params = set(self.get_required_parameters())
+        required_params = frozenset(self.get_required_parameters())
         optional_params = set(self.get_optional_parameters())
 
-        if self.get_id() in self.required_args_all:
+        if self.id in self.required_args_all:
             required_params_x = [required_params]
 
         else:
@@ -333,8 +504,9 @@ class UEXEndpointDocsParser:
             yield from self.create_method_urls_for_all_optional_params(base_endpoint_path, optional_params_x, [])
 
         for requireds in required_params_x:
-            optional_params_x.extend(required_params.difference(requireds))
-            yield from self.create_method_urls_for_all_optional_params(base_endpoint_path, optional_params_x, requireds)
+            # the other required parameters may be used as optional ones for this variant
+            optional_params_with_requireds_x = [*optional_params_x, *required_params.difference(requireds)]
+            yield from self.create_method_urls_for_all_optional_params(base_endpoint_path, optional_params_with_requireds_x, requireds)
 
     def create_method_urls_for_all_optional_params(
             self,
@@ -362,22 +534,22 @@ class UEXEndpointDocsParser:
             optional_params: Sequence[UEXEndpointParameter],
             required_params: Sequence[UEXEndpointParameter]
     ) -> UEXEndpointLink:
-        parameters_path = "/"
+        parameters_path_parts = [""]
         for parameter in required_params:
-            parameters_path += f"{parameter.name}/{self.get_defaults(parameter.name)}/"
-
-        parameters_query = {}
-        for parameter in optional_params:
-            parameters_query[parameter.name] = self.get_defaults(parameter.name, "")
+            parameters_path_parts += [parameter.name, str(self.get_defaults(parameter.name))]
 
-        parameters_query_str = "&".join([f"{key}={value}" for key, value in parameters_query.items()])
+        parameters_path = "/".join(parameters_path_parts) + "/"
+        parameters_query_str = urllib.parse.urlencode({
+            parameter.name: self.get_defaults(parameter.name, "")
+            for parameter in optional_params
+        })
         if parameters_query_str:
             parameters_query_str = f"?{parameters_query_str}"
 
         url = f"{base_endpoint_path}{parameters_path}" if self.get_templated_paths else f"{base_endpoint_path}{parameters_path}{parameters_query_str}"
         return UEXEndpointLink(
             link=url,
-            required_params=list(required_params),
+            required_params=tuple(required_params),
         )
 
 
@@ -386,45 +558,92 @@ class DocsParser:
     def __init__(self, settings: Settings = None):
         self.settings = settings
         self.web_session = requests.Session()
+        self.web_session.mount("https://", create_http_adapter())
         self.web_session.verify = False
         self.web_session.auth = ("supporter", "uex")
 
     def run(self) -> Generator[UEXEndpoint, Any, None]:
         response_data = get_from_cache_or_request(self.web_session, self.settings.docs_path, self.settings)
-        soup = bs4.BeautifulSoup(response_data, "html.parser")
-        endpoint_links = list(self.find_endpoint_links(soup))
+        tree = LexborHTMLParser(response_data)
+        endpoint_links = list(self.find_endpoint_links(tree))
         log.info("discovered %d endpoints", len(endpoint_links))
         if len(endpoint_links) == 0:
             log.error("no endpoint links found")
 
-        for link in endpoint_links:
-            try:
-                yield self.process_endpoint_docs(link)
-
-            except HTTPError:
-                log.exception("failed to process endpoint %s", link)
-                continue
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {
+                link: executor.submit(self.process_endpoint_docs, link)
+                for link in endpoint_links
+            }
+            for link, future in futures.items():
+                try:
+                    yield future.result()
+
+                except HTTPError:
+                    log.exception("failed to process endpoint %s", link)
+                    continue
 
     def process_endpoint_docs(self, link) -> UEXEndpoint:
         response_data = get_from_cache_or_request(self.web_session, link, self.settings)
+        cache_path = self.get_endpoint_cache_path(link, response_data)
+        if cache_path.exists() and self.settings.api_cache:
+            log.debug(f"using parsed cache for {link}")
+            try:
+                with gzip.open(cache_path, "rb") as fd:
+                    endpoint = pickle.load(fd)
+
+                log.info("discovered endpoint: %s %s (%s)", endpoint.method, endpoint.id, endpoint.description)
+                return endpoint
+
+            except Exception:
+                log.warning("failed to load parsed cache for %s, parsing the docs again", link, exc_info=True)
+
         parser = UEXEndpointDocsParser(link, response_data, get_templated_paths=self.settings.get_templated_paths)
         endpoint_id = parser.get_id()
         log.info("discovered endpoint: %s %s (%s)", parser.get_method(), endpoint_id, parser.get_description())
-        link_versions = parser.create_method_paths_for_all_params()
-        return UEXEndpoint(
+        if parser.get_method() != "GET" and not self.settings.get_templated_paths:
+            # only GET endpoints are requested by the collector, templated paths are needed for all of them
+            log.debug("skipping link generation for non-GET endpoint: %s", parser.get_method())
+            link_versions = ()
+
+        else:
+            link_versions = parser.create_method_paths_for_all_params()
+
+        endpoint = UEXEndpoint(
             id=endpoint_id,
             method=parser.get_method(),
             base_path=parser.get_base_path(),
             description=parser.get_description(),
             docs_url=link,
             is_user_bound=parser.is_user_bound(),
-            links=list(link_versions),
+            links=tuple(link_versions),
         )
 
+        if not self.settings.api_cache:
+            return endpoint
+
+        # written under a temporary name first, an interrupted run must not leave a truncated entry behind
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_cache_path = cache_path.with_name(f"{cache_path.name}.{threading.get_ident()}.tmp")
+        with gzip.open(tmp_cache_path, "wb") as fd:
+            pickle.dump(endpoint, fd)
+
+        os.replace(tmp_cache_path, cache_path)
+        return endpoint
+
+    def get_endpoint_cache_path(self, link: str, content: str) -> Path:
+        # generated links differ for templated paths, the page content invalidates outdated entries
+        # and the generator version invalidates entries created with different defaults or parsing code
+        cache_key = hashlib.sha1(
+            f"{generator_version}\n{link}\n{self.settings.get_templated_paths}\n{content}".encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+        return cache_dir / f"{cache_key}.pkl.gz"
+
     @staticmethod
-    def find_endpoint_links(soup: bs4.BeautifulSoup) -> Iterator[str]:
-        for link_tag in soup.select("p.mgb-5.pdl-10 a"):
-            yield link_tag["href"]
+    def find_endpoint_links(tree: LexborHTMLParser) -> Iterator[str]:
+        for link_tag in tree.css("p.mgb-5.pdl-10 a"):
+            yield link_tag.attrs["href"]
 
 
 class APICollector:
@@ -489,6 +708,12 @@ class APICollector:
 
     def __init__(self, settings: Settings = None):
         self.settings = settings
+        self._tag_literals = {}
+        self._tag_regex = {}
+        for tag, paths in self.tag_mapping.items():
+            patterns = [path.pattern for path in paths if isinstance(path, re.Pattern)]
+            self._tag_literals[tag] = {path for path in paths if isinstance(path, str)}
+            self._tag_regex[tag] = re.compile("|".join(patterns)) if patterns else None
         self.api_session = create_api_session()
         self.docs_parser = DocsParser(settings)
 
@@ -497,39 +722,36 @@ class APICollector:
         self.collect(endpoints)
 
     def collect(self, all_endpoints: Sequence[UEXEndpoint]):
-        for endpoint in all_endpoints:
-            try:
-                self.collect_endpoint(endpoint)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [
+                future
+                for endpoint in all_endpoints
+                for future in self.collect_endpoint(endpoint, executor)
+            ]
+            for future in as_completed(futures):
+                try:
+                    _ = future.result()
 
-            except HTTPError:
-                continue
+                except HTTPError:
+                    continue
 
-    def collect_endpoint(self, endpoint):
+    def collect_endpoint(self, endpoint, executor: Executor) -> Iterator[Future]:
         if endpoint.method != "GET":
             log.debug("skipping non-GET endpoint: %s", endpoint.method)
             return
 
         for endpoint_variant in endpoint.links:
-            _ = get_from_cache_or_request(self.api_session, self.settings.base_path + endpoint_variant.link, self.settings)
+            yield executor.submit(get_from_cache_or_request, self.api_session, self.settings.base_path + endpoint_variant.link, self.settings)
 
     def get_tags(self, endpoint: UEXEndpoint) -> list[str]:
         tags = []
         if endpoint.is_user_bound:
             tags.append("User")
 
-        for tag, paths in self.tag_mapping.items():
-            if endpoint.base_path in paths:
+        for tag in self.tag_mapping:
+            tag_regex = self._tag_regex[tag]
+            if endpoint.base_path in self._tag_literals[tag] or (tag_regex and tag_regex.match(endpoint.base_path)):
                 tags.append(tag)
-                continue
-
-            for path in paths:
-                if isinstance(path, str) and endpoint.base_path == path:
-                    tags.append(tag)
-                    break
-
-                elif isinstance(path, re.Pattern) and path.match(endpoint.base_path):
-                    tags.append(tag)
-                    break
 
         return tags
 
@@ -610,56 +832,80 @@ class OpenAPIManager:
         "GetVehiclesRentalsPricesOkResponse.properties.data.items": "VehicleRentalPriceDTO",
     }
 
+    schema_property_paths = [
+        (tuple(selector.split(".")), ref)
+        for selector, ref in schema_name_by_property_path.items()
+    ]
+
     def __init__(self):
         self.schema = {"paths": {}}
+        self._schema_hash_index: dict[bytes, str] = {}
+        # canonical keys by object id, the object is kept to detect reused ids
+        self._canon_cache: dict[int, tuple[Any, bytes]] = {}
+        self._ref_str_cache: dict[str, str] = {}
         self.read()
 
     def read(self):
-        with open("openapi.yaml", "r") as fd:
-            self.schema = yaml.safe_load(fd) or self.schema
+        self.schema = load_yaml_file("openapi.yaml") or self.schema
 
-    def write(self):
-        with open("openapi.yaml", "w") as fd:
-            yaml.dump(self.schema, fd)
+    def write(self, output_format: "OutputFormat" = None):
+        match output_format:
+            case OutputFormat.JSON:
+                with open("openapi.json", "wb") as fd:
+                    if orjson is not None:
+                        fd.write(orjson.dumps(self.schema, option=orjson.OPT_INDENT_2, default=str))
 
-    def add_paths(self, paths: Sequence[str]):
+                    else:
+                        fd.write(json.dumps(self.schema, indent=2, default=str).encode())
+
+            case _:
+                with open("openapi.yaml", "w", encoding="utf-8") as fd:
+                    dump_yaml(
+                        self.schema,
+                        fd,
+                        default_flow_style=False,
+                        allow_unicode=True,
+                        width=10_000_000,
+                    )
+
+    def add_paths(self, paths: Iterable[str]):
         paths = list(paths)
         self.schema["x-path-templates"] = paths + self.schema["x-path-templates"]
 
-    def update_path_data(self, data_by_path: dict[str, dict]):
-        for schema_path, schema_operations in self.schema["paths"].items():
-            for schema_operation, schema_operation_props in schema_operations.items():
-                if schema_path in data_by_path:
-                    # there are operations defined for current schema path
-                    path_operation_mapping = data_by_path[schema_path]
-                    if schema_operation in path_operation_mapping:
-                        # data is defined for current schema path and operation
-                        schema_operation_props.update(path_operation_mapping[schema_operation])
-
-                    else:
-                        log.warning(f"no data not set for %s %s", schema_operation, schema_path)
+    def update_path(self, path: str, operation: str, data: dict):
+        schema_operations = self.schema["paths"].get(path, {})
+        if operation in schema_operations:
+            # data is defined for current schema path and operation
+            schema_operations[operation].update(data)
 
-                else:
+    def warn_missing_path_data(self, operations_with_data: set[tuple[str, str]]):
+        paths_with_data = {path for path, _ in operations_with_data}
+        for schema_path, schema_operations in self.schema["paths"].items():
+            for schema_operation in schema_operations:
+                if schema_path not in paths_with_data:
                     log.warning(f"no data mapping set for %s", schema_path)
 
-    def deep_get_overwrite(self, d, keys: list[str], value: Any = None):
-        if len(keys) == 1 and value is not None:
-            d[keys[0]] = value
-            return d
+                elif (schema_path, schema_operation) not in operations_with_data:
+                    log.warning(f"no data not set for %s %s", schema_operation, schema_path)
 
-        elif len(keys) > 0:
-            if isinstance(d, dict):
-                key = keys[0]
-                if key not in d:
-                    d[key] = {}
+    def deep_get_overwrite(self, d, keys: Sequence[str], value: Any = None):
+        overwrite = value is not None and len(keys) > 0
+        for key in keys[:-1] if overwrite else keys:
+            if not isinstance(d, dict):
+                raise Exception(f"expected dict, got {type(d)}")
 
-                return self.deep_get_overwrite(d.get(key), keys[1:], value=value)
+            if key not in d:
+                d[key] = {}
+                # the canonical form of all containing dicts changed
+                self._canon_cache.clear()
 
-            else:
-                raise Exception(f"expected dict, got {type(d)}")
+            d = d[key]
 
-        else:
-            return d
+        if overwrite:
+            d[keys[-1]] = value
+            self._canon_cache.clear()
+
+        return d
 
     def overwrite_keys(self, key: str, data: dict):
         keys = key.split(".")
@@ -668,30 +914,38 @@ class OpenAPIManager:
         self.deep_get_overwrite(self.schema, keys, value=source)
 
     def deep_equals(self, item1, item2):
-        if isinstance(item1, dict) and isinstance(item2, dict):
-            item2_keys = set(item2.keys())
-            for key, value in item1.items():
-                if key not in item2:
-                    return False
+        # cheap checks first, serializing differently shaped values is wasted work
+        if type(item1) is not type(item2):
+            return False
 
-                item2_keys.remove(key)
-                if not self.deep_equals(value, item2[key]):
-                    return False
+        if isinstance(item1, (dict, list)) and len(item1) != len(item2):
+            return False
 
-            return len(item2_keys) == 0
+        return self.get_canonical_key(item1) == self.get_canonical_key(item2)
 
-        elif isinstance(item1, list) and isinstance(item2, list):
-            if len(item1) != len(item2):
-                return False
+    def get_canonical_key(self, obj: Any) -> bytes:
+        cached = self._canon_cache.get(id(obj))
+        if cached is not None and cached[0] is obj:
+            return cached[1]
 
-            for i in range(len(item1)):
-                if not self.deep_equals(item1[i], item2[i]):
-                    return False
+        key = canonical_key(obj)
+        self._canon_cache[id(obj)] = (obj, key)
+        return key
 
-            return True
+    def invalidate_canonical_keys(self, *objs: Any):
+        for obj in objs:
+            self._canon_cache.pop(id(obj), None)
 
-        else:
-            return item1 == item2
+    def get_schema_hash(self, obj: Any) -> bytes:
+        return hashlib.blake2b(self.get_canonical_key(obj), digest_size=16).digest()
+
+    def get_schema_ref(self, schema_name: str) -> str:
+        ref = self._ref_str_cache.get(schema_name)
+        if ref is None:
+            ref = sys.intern(f"#/components/schemas/{schema_name}")
+            self._ref_str_cache[schema_name] = ref
+
+        return ref
 
     def add_new_schema(self, name: str, schema: dict):
         if "components" not in self.schema:
@@ -702,7 +956,8 @@ class OpenAPIManager:
 
         if name not in self.schema["components"]["schemas"]:
             log.debug("creating new component schema %s: %s", name, schema)
-            self.schema["components"]["schemas"][name] = copy.deepcopy(schema)
+            assert is_json_native(schema), f"schema {name} contains values that are not JSON native"
+            self.schema["components"]["schemas"][name] = copy_json(schema)
 
         else:
             existing_schema = self.schema["components"]["schemas"][name]
@@ -742,18 +997,17 @@ class OpenAPIManager:
                             continue
 
                         schema_props = content_props["schema"]
-                        new_ref = stringcase.pascalcase(f"{operation.lower()}_{endpoint_name}_{response_code_str.lower()}_response")
+                        new_ref = pascalcase(f"{operation.lower()}_{endpoint_name}_{response_code_str.lower()}_response")
                         self.add_new_schema(new_ref, schema_props)
                         content_props["schema"] = {
-                            "$ref": f"#/components/schemas/{new_ref}",
+                            "$ref": self.get_schema_ref(new_ref),
                         }
 
     def extract_schemas(self):
         if "schemas" not in self.schema["components"]:
             return
 
-        for selector, ref in self.schema_name_by_property_path.items():
-            selector_items = selector.split(".")
+        for selector_items, ref in self.schema_property_paths:
             target_schema = selector_items[0]
             target_prop_path = selector_items[1:]
             if target_schema not in self.schema["components"]["schemas"]:
@@ -765,38 +1019,55 @@ class OpenAPIManager:
             self.add_new_schema(ref, new_schema_props)
             log.debug("updating schema ref of %s to %s", target_schema, ref)
             self.deep_get_overwrite(schema, target_prop_path, value={
-                "$ref": f"#/components/schemas/{ref}",
+                "$ref": self.get_schema_ref(ref),
             })
 
+    def index_schemas(self):
+        # component schemas may have been modified since they were added, index their current state
+        self._canon_cache.clear()
+        self._schema_hash_index = {}
+        for schema_name, schema in self.schema["components"]["schemas"].items():
+            # identical schemas are referenced by the first defined name
+            self._schema_hash_index.setdefault(self.get_schema_hash(schema), schema_name)
+
     def consolidate_recursive_object_references(self):
         if "schemas" not in self.schema["components"]:
             return
 
-        def process_schema(schema: dict):
-            if "properties" in schema:
-                schema_props = schema["properties"]
-                for prop_name, prop_values in schema_props.items():
-                    if "items" in prop_values:
-                        if "$ref" not in prop_values["items"]:
-                            for schema_name, schema in self.schema["components"]["schemas"].items():
-                                if self.deep_equals(prop_values["items"], schema):
-                                    schema_props[prop_name]["items"] = {
-                                        "$ref": f"#/components/schemas/{schema_name}",
-                                    }
-                                    continue
-
-                    elif "$ref" not in prop_values:
-                        for schema_name, schema in self.schema["components"]["schemas"].items():
-                            if self.deep_equals(prop_values, schema):
-                                schema_props[prop_name] = {
-                                    "$ref": f"#/components/schemas/{schema_name}",
-                                }
-                                continue
-
-                        process_schema(prop_values)
-
+        self.index_schemas()
         for schema in self.schema["components"]["schemas"].values():
-            process_schema(schema)
+            self.consolidate_schema_references(schema)
+
+    def consolidate_schema_references(self, root_schema: dict):
+        # ancestors of each schema are kept to invalidate their canonical keys when the schema changes
+        stack = [(root_schema, ())]
+        while stack:
+            schema, ancestors = stack.pop()
+            # referenced schemas are consolidated on their own
+            if not isinstance(schema, dict) or "$ref" in schema or "properties" not in schema:
+                continue
+
+            schema_props = schema["properties"]
+            for prop_name, prop_values in schema_props.items():
+                if "items" in prop_values:
+                    if "$ref" not in prop_values["items"]:
+                        schema_name = self._schema_hash_index.get(self.get_schema_hash(prop_values["items"]))
+                        if schema_name is not None:
+                            schema_props[prop_name]["items"] = {
+                                "$ref": self.get_schema_ref(schema_name),
+                            }
+                            self.invalidate_canonical_keys(prop_values, schema_props, schema, *ancestors)
+
+                elif "$ref" not in prop_values:
+                    schema_name = self._schema_hash_index.get(self.get_schema_hash(prop_values))
+                    if schema_name is not None:
+                        schema_props[prop_name] = {
+                            "$ref": self.get_schema_ref(schema_name),
+                        }
+                        self.invalidate_canonical_keys(schema_props, schema, *ancestors)
+
+                    # replaced properties are skipped, their original definition is no longer part of the schema
+                    stack.append((schema_props[prop_name], (schema_props, schema, *ancestors)))
 
 
 class Mode(Enum):
@@ -806,10 +1077,98 @@ class Mode(Enum):
     MERGE = "merge"
 
 
+class OutputFormat(Enum):
+    YAML = "yaml"
+    JSON = "json"
+
+
+def run_collect(collector: APICollector, settings: Settings, args: argparse.Namespace):
+    collector.run()
+
+
+def run_apply_templates(collector: APICollector, settings: Settings, args: argparse.Namespace):
+    settings.get_templated_paths = True
+    endpoints = collector.docs_parser.run()
+
+    manager = OpenAPIManager()
+    for endpoint in endpoints:
+        log.debug("adding %d templated paths of %s", len(endpoint.links), endpoint.docs_url)
+        # links are already unique per endpoint
+        manager.add_paths(item.link for item in endpoint.links)
+
+    manager.write(args.format)
+
+
+def run_fixup(collector: APICollector, settings: Settings, args: argparse.Namespace):
+    settings.get_templated_paths = True
+    endpoints = collector.docs_parser.run()
+
+    manager = OpenAPIManager()
+    operations_with_data = set()
+    operation_data_prototype = dict.fromkeys(["operationId", "summary", "tags", "security"])
+    for endpoint in endpoints:
+        manager.create_initial_response_schemas(endpoint)
+        method_lc = endpoint.method.lower()
+        tags = collector.get_tags(endpoint)
+        for link_template in endpoint.links:
+            operation_id_suffix = ""
+            if link_template.required_params:
+                operation_id_suffix = "_by_" + "_and_".join(
+                    p.name.replace("id_", "") for p in link_template.required_params
+                )
+
+            operation_data = operation_data_prototype.copy()
+            operation_data["operationId"] = pascalcase(f"{method_lc}_{endpoint.id}{operation_id_suffix}")
+            operation_data["summary"] = endpoint.description
+            # objects shared between operations would be dumped as YAML anchors and aliases
+            operation_data["tags"] = list(tags)
+            operation_data["security"] = collector.get_security(endpoint)
+            operation_key = (link_template.link, method_lc)
+            if operation_key in operations_with_data:
+                log.warning("data for %s %s already set by another endpoint, overwriting with %s", method_lc, link_template.link, endpoint.id)
+
+            manager.update_path(link_template.link, method_lc, operation_data)
+            operations_with_data.add(operation_key)
+
+    manager.warn_missing_path_data(operations_with_data)
+    manager.extract_schemas()
+    # manager.consolidate_recursive_object_references()
+
+    manager.write(args.format)
+
+
+def run_merge(collector: APICollector, settings: Settings, args: argparse.Namespace):
+    attributes_to_merge = [
+        "openapi",
+        "info",
+        "servers",
+        "externalDocs",
+        "tags",
+        "components.securitySchemes",
+    ]
+
+    new_schema = load_yaml_file("openapi.base.yaml") or {"paths": {}}
+
+    manager = OpenAPIManager()
+    for key in attributes_to_merge:
+        manager.overwrite_keys(key, new_schema)
+
+    manager.write(args.format)
+
+
+DISPATCH = {
+    Mode.COLLECT: run_collect,
+    Mode.APPLY_TEMPLATES: run_apply_templates,
+    Mode.FIXUP: run_fixup,
+    Mode.MERGE: run_merge,
+}
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("mode", type=Mode)
     parser.add_argument("--no-api-cache", action="store_true", default=False)
+    parser.add_argument("--format", type=OutputFormat, default=OutputFormat.YAML)
     args = parser.parse_args()
 
     settings = Settings(
@@ -817,66 +1176,4 @@ if __name__ == "__main__":
     )
     collector = APICollector(settings=settings)
 
-    match args.mode:
-        case Mode.COLLECT:
-            collector.run()
-
-        case Mode.APPLY_TEMPLATES:
-            settings.get_templated_paths = True
-            endpoints = collector.docs_parser.run()
-
-            manager = OpenAPIManager()
-            for endpoint in endpoints:
-                link_templates = {item.link for item in endpoint.links}
-                log.debug("adding templated paths: %s", link_templates)
-                manager.add_paths(link_templates)
-
-            manager.write()
-
-        case Mode.FIXUP:
-            settings.get_templated_paths = True
-            endpoints = collector.docs_parser.run()
-
-            manager = OpenAPIManager()
-            data_mappings = {}
-            for endpoint in endpoints:
-                manager.create_initial_response_schemas(endpoint)
-                for link_template in endpoint.links:
-                    operation_id_suffix = ""
-                    if link_template.required_params:
-                        operation_id_suffix = "_by_" + "_and_".join(
-                            [p.name.replace("id_", "") for p in link_template.required_params]
-                        )
-                    data_mappings[link_template.link] = {
-                        endpoint.method.lower(): {
-                            "operationId": stringcase.pascalcase(f"{endpoint.method.lower()}_{endpoint.id}{operation_id_suffix}"),
-                            "summary": endpoint.description,
-                            "tags": collector.get_tags(endpoint),
-                            "security": collector.get_security(endpoint),
-                        },
-                    }
-
-            manager.update_path_data(data_mappings)
-            manager.extract_schemas()
-            # manager.consolidate_recursive_object_references()
-
-            manager.write()
-
-        case Mode.MERGE:
-            attributes_to_merge = [
-                "openapi",
-                "info",
-                "servers",
-                "externalDocs",
-                "tags",
-                "components.securitySchemes",
-            ]
-
-            with open("openapi.base.yaml", "r") as fd:
-                new_schema = yaml.safe_load(fd) or {"paths": {}}
-
-            manager = OpenAPIManager()
-            for key in attributes_to_merge:
-                manager.overwrite_keys(key, new_schema)
-
-            manager.write()
+    DISPATCH[args.mode](collector, settings, args)
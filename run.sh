@@ -1,5 +1,5 @@
 #! /usr/bin/env nix-shell
-#! nix-shell -I nixpkgs=https://github.com/NixOS/nixpkgs/archive/e44462d6021bfe23dfb24b775cc7c390844f773d.tar.gz -i bash -p bash mitmproxy mitmproxy2swagger openapi-generator-cli python310Packages.pyyaml python310Packages.requests python310Packages.beautifulsoup4 python310Packages.stringcase
+#! nix-shell -I nixpkgs=https://github.com/NixOS/nixpkgs/archive/e44462d6021bfe23dfb24b775cc7c390844f773d.tar.gz -i bash -p bash mitmproxy mitmproxy2swagger openapi-generator-cli python310Packages.pyyaml python310Packages.requests python310Packages.selectolax
 
 if [ -z "$APP_TOKEN" ]; then
     >&2 echo "ERROR: Application authorization token undefined"